@@ -1,10 +1,295 @@
 
+import heapq
 import json
+import multiprocessing
 import os
+import re
 import string
+from collections import Counter
+from functools import partial
+from itertools import islice
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_ENCODE_CACHE_SIZE = 65536
+_ENCODE_CACHE_MAX_PIECE_LEN = 64
+
+def _json_dumps(obj):
+    """Serializes obj to ASCII JSON bytes, with orjson if available.
+
+    orjson writes non-ASCII characters as raw UTF-8, so its output is only
+    used when it is pure ASCII. Otherwise the json module escapes them, as
+    json.dump always did, keeping files readable under any locale encoding.
+
+    """
+    if orjson is not None:
+        data = orjson.dumps(obj)
+        if data.isascii():
+            return data
+    return json.dumps(obj).encode("ascii")
+
+def _json_loads(data):
+    """Deserializes JSON bytes, with orjson if available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _count_corpus(corpus, word_level):
+    """Counts training texts and characters of a corpus in a single pass.
+
+    Args:
+        corpus: Iterable of corpus lines.
+        word_level: Whether training texts are space-separated words or lines.
+
+    Returns:
+        Tuple of Counters of training texts and of characters.
+
+    """
+    text_counts = Counter()
+    char_counts = Counter()
+    for line in corpus:
+        char_counts.update(line)
+        if word_level:
+            text_counts.update(line.split())
+        else:
+            text_counts[line] += 1
+    return text_counts, char_counts
+
+def _count_file(corpus_file_path, word_level):
+    """Streams a corpus text file through _count_corpus."""
+    with open(corpus_file_path, "r") as f:
+        return _count_corpus((l.strip() for l in f), word_level)
+
+class _MergeCandidates:
+    """Merge candidates of a training corpus, maintained across merges.
+
+    Training texts are greedily segmented through the merge table. Where a
+    segment cannot be extended by the next character, the (segment,
+    character) pair is a merge candidate. Pairs of ids are packed into
+    single ints, (left << 32) | right, like the keys of the merge table.
+
+    Candidates are updated incrementally rather than recounted over the
+    whole corpus after every merge. text_segs[w] maps the start of each
+    segment of text w to its candidate, and each candidate to the set of
+    its segment starts in the text. first_seen holds the (text, start) of
+    the first occurrence of a candidate, used to break count ties in corpus
+    order. When that occurrence goes away, first_seen is kept as a lower
+    bound and the candidate marked in stale_first until it reaches the top
+    of the heap. Heap keys may be better than a candidate's current key,
+    since entries are only pushed when the key may have improved; popped
+    entries are checked and pushed again with the current key if needed.
+
+    """
+
+    def __init__(self, texts, text_freqs, symbols, merges):
+        """Segments all texts and counts their candidates.
+
+        Args:
+            texts: Training texts as lists of character ids.
+            text_freqs: Frequency of each training text.
+            symbols: Symbol strings by id, extended by the trainer.
+            merges: Merge table mapping packed pairs to ids, extended by the
+                trainer.
+
+        """
+        self.texts = texts
+        self.text_freqs = text_freqs
+        self.symbols = symbols
+        self.merges = merges
+        self.text_segs = []
+        self.pair_counts = {}
+        self.occurrences = {}
+        self.first_seen = {}
+        self.stale_first = set()
+        for w, text in enumerate(texts):
+            segs, where = self._scan(text)
+            self.text_segs.append((segs, where))
+            inc = text_freqs[w]
+            for cand, starts in where.items():
+                if cand in self.pair_counts:
+                    self.pair_counts[cand] += inc * len(starts)
+                    self.occurrences[cand].add(w)
+                else:
+                    self.pair_counts[cand] = inc * len(starts)
+                    self.occurrences[cand] = {w}
+                    self.first_seen[cand] = (w, min(starts))
+        self.heap = [(-count, *self.first_seen[cand], cand) for cand, count in self.pair_counts.items()]
+        heapq.heapify(self.heap)
+
+    def _scan(self, ids):
+        """Greedily segments a text and collects its merge candidates.
+
+        Args:
+            ids: Character ids of the text to segment.
+
+        Returns:
+            Tuple of a dict mapping segment starts to their candidates and a
+            dict mapping candidates to sets of their starts.
+
+        """
+        segs = {}
+        where = {}
+        merges_get = self.merges.get
+        i = 0
+        node = ids[0]
+        for j in range(1, len(ids)):
+            pair = (node << 32) | ids[j]
+            merged = merges_get(pair)
+            if merged is None:
+                segs[i] = pair
+                if pair in where:
+                    where[pair].add(i)
+                else:
+                    where[pair] = {i}
+                i = j
+                node = ids[j]
+            else:
+                node = merged
+        return segs, where
+
+    def pop_best(self):
+        """Finds the most frequent candidate, first in corpus order on ties.
+
+        Returns:
+            Tuple of the candidate and its count, or None if there are no
+            candidates left.
+
+        """
+        heap = self.heap
+        pair_counts = self.pair_counts
+        first_seen = self.first_seen
+        while heap:
+            neg_count, w, i, cand = heapq.heappop(heap)
+            count = pair_counts.get(cand)
+            if count is None:
+                continue
+            if cand in self.stale_first:
+                self.stale_first.discard(cand)
+                first_w = min(self.occurrences[cand])
+                first_seen[cand] = (first_w, min(self.text_segs[first_w][1][cand]))
+            if count == -neg_count and first_seen[cand] == (w, i):
+                return cand, count
+            heapq.heappush(heap, (-count, *first_seen[cand], cand))
+        return None
+
+    def apply_merge(self, merged):
+        """Updates the candidates after merged was added to the merge table.
+
+        Args:
+            merged: Candidate that was merged.
+
+        """
+        for w in sorted(self.occurrences[merged]):
+            self._rescan_text(w, merged)
+
+    def _rescan_text(self, w, merged):
+        """Updates the candidates of text w after merged was added.
+
+        The greedy scan only changes where it used to stop on merged, so each
+        such segment is scanned again until it lines up with an old segment
+        start, from where the old segments are kept as they are. Old segments
+        are followed by their length, so only the segments that change are
+        visited. Counts, occurrences and first occurrences of the candidates
+        that changed are then updated, and heap entries pushed for those
+        whose key may have improved.
+
+        Args:
+            w: Index of the text to update.
+            merged: Candidate that was merged.
+
+        """
+        ids = self.texts[w]
+        inc = self.text_freqs[w]
+        segs, where = self.text_segs[w]
+        symbols = self.symbols
+        n = len(ids)
+        merges_get = self.merges.get
+        deltas = {}
+        added = {}
+        removed = []
+
+        def remove_segment(p):
+            old = segs.pop(p)
+            starts = where[old]
+            starts.discard(p)
+            if not starts:
+                del where[old]
+            deltas[old] = deltas.get(old, 0) - inc
+            removed.append((old, p))
+            return p + len(symbols[old >> 32])
+
+        for i in sorted(where[merged]):
+            if segs.get(i) != merged:
+                continue
+            # p is the start of the next old segment, the last segment has no
+            # candidate and runs to the end of the text.
+            p = i
+            node = ids[i]
+            for j in range(i + 1, n):
+                cand = (node << 32) | ids[j]
+                node = merges_get(cand)
+                if node is not None:
+                    continue
+                while p < j:
+                    p = remove_segment(p) if p in segs else n
+                segs[i] = cand
+                if cand in where:
+                    where[cand].add(i)
+                else:
+                    where[cand] = {i}
+                deltas[cand] = deltas.get(cand, 0) + inc
+                if i < added.get(cand, n):
+                    added[cand] = i
+                i = j
+                node = ids[j]
+                if p == j:
+                    break
+            else:
+                while p in segs:
+                    p = remove_segment(p)
+
+        pair_counts = self.pair_counts
+        occurrences = self.occurrences
+        first_seen = self.first_seen
+        stale_first = self.stale_first
+        for cand, p in removed:
+            if first_seen.get(cand) == (w, p):
+                stale_first.add(cand)
+        for cand, delta in deltas.items():
+            count = pair_counts.get(cand, 0) + delta
+            if count == 0:
+                del pair_counts[cand]
+                del occurrences[cand]
+                del first_seen[cand]
+                stale_first.discard(cand)
+                continue
+            pair_counts[cand] = count
+            if cand in where:
+                occurrences.setdefault(cand, set()).add(w)
+                start = added.get(cand)
+                if start is not None:
+                    first = first_seen.get(cand)
+                    if first is None or first > (w, start):
+                        first_seen[cand] = (w, start)
+                        stale_first.discard(cand)
+                if delta >= 0:
+                    heapq.heappush(self.heap, (-count, *first_seen[cand], cand))
+            else:
+                occurrences[cand].discard(w)
+                if first_seen[cand][0] == w:
+                    stale_first.add(cand)
 
 class BPETokenizer:
-    def __init__(self, corpus_or_txt_path=None, vocab_size=None, vocab_or_json_path=None):
+    _UNK = "<|UNK|>"
+    _PAD = "<|PAD|>"
+    _SOS = "<|SOS|>"
+    _EOS = "<|EOS|>"
+    _RESERVED_IDS = {_PAD: 0, _UNK: -999, _SOS: -1, _EOS: -2}
+
+    def __init__(self, corpus_or_txt_path=None, vocab_size=None, vocab_or_json_path=None, verbose=False):
         """Constructor to initialize BPE Tokenizer.
 
         Supports three initialization modes:
@@ -19,24 +304,31 @@ class BPETokenizer:
             corpus_or_txt_path: Path to corpus text file to train vocab on.
             vocab_size: Desired size of new vocabulary to train. 
             vocab_or_json_path: Path to pre-trained vocab json file.
+            verbose: Whether to print vocabulary and training progress.
 
         """
-        self._UNK = "<|UNK|>"
-        self._PAD = "<|PAD|>"
-        self._SOS = "<|SOS|>"
-        self._EOS = "<|EOS|>"
+        self.verbose = verbose
+        self._special_re = re.compile("|".join(re.escape(s) for s in (self._PAD, self._UNK, self._SOS, self._EOS)))
         self._default_chars = [self._PAD] + list(string.ascii_letters + string.digits + string.punctuation + " ") + [self._UNK] + [self._SOS] + [self._EOS]
         self.vocab_size = None
         self.vocab = None
         self.encoder_dict = None
         self.decoder_dict = None
+        self._merges = []
+        self._merged_ids = {}
+        self._unmerged_symbols = []
+        self._special_ids = {}
+        self._split_on_spaces = True
+        self._encode_cache = {}
+        self._encode_cache_old = {}
+        self._unk_count = 0
         self._init_vocab()
         if vocab_or_json_path:
             if os.path.isfile(vocab_or_json_path):
                 if not vocab_or_json_path.endswith(".json"):
                     raise ValueError("Vocab file must be a json file")
-                with open(vocab_or_json_path, "r") as f:
-                    vocab_dict = json.load(f)
+                with open(vocab_or_json_path, "rb") as f:
+                    vocab_dict = _json_loads(f.read())
                     vocab_or_json_path = vocab_dict
             self._update_vocab(vocab_or_json_path)
         elif vocab_size and corpus_or_txt_path:
@@ -48,7 +340,8 @@ class BPETokenizer:
             else:
                 self.train(corpus_or_txt_path, vocab_size)
         else:
-            print(f"Initialized unconfigured BPE Tokenizer.")
+            if self.verbose:
+                print(f"Initialized unconfigured BPE Tokenizer.")
             self._rebuild_token_dict()
 
     def _init_vocab(self):
@@ -65,9 +358,9 @@ class BPETokenizer:
         vocab = {}
         for element in vocab_elements:
             vocab[element] = 0
-        self.vocab_size = len(vocab.keys()) if not self.vocab_size or self.vocab_size < len(vocab.keys()) else self.vocab_size
+        self.vocab_size = len(vocab) if not self.vocab_size or self.vocab_size < len(vocab) else self.vocab_size
         self.vocab = vocab
-        self._set_vocab_size(len(self.vocab.keys()))
+        self._set_vocab_size(len(self.vocab))
     
     def _update_vocab(self, vocab):
         """Updates internal vocabulary dictionary from external vocab.
@@ -78,6 +371,11 @@ class BPETokenizer:
 
         Also updates internal vocab_size attribute to match new dict size.
 
+        Symbols not yet in the token dicts are appended to them, which
+        assigns the same indices as a rebuild. The dicts are only rebuilt
+        from scratch if none exist yet or if some symbol could not be
+        derived from shorter ones, as a new symbol might complete it.
+
         Used to load pretrained vocabulary.
 
         Args:
@@ -86,16 +384,21 @@ class BPETokenizer:
         """
         for key, value in vocab.items():
             self.vocab[key] = value
-        print(f"Updated vocab with {len(self.vocab.keys())} elements")
-        self._set_vocab_size(len(self.vocab.keys()))
-        self._rebuild_token_dict()
+        if self.verbose:
+            print(f"Updated vocab with {len(self.vocab)} elements")
+        self._set_vocab_size(len(self.vocab))
+        if self.encoder_dict is None or self._unmerged_symbols:
+            self._rebuild_token_dict()
+        else:
+            self._extend_token_dict(list(islice(self.vocab, len(self.encoder_dict), None)))
 
     def _set_vocab_size(self, vocab_size):
-        if vocab_size >= len(self.vocab.keys()):
+        if vocab_size >= len(self.vocab):
             self.vocab_size = vocab_size
         else:
-            self.vocab_size = len(self.vocab.keys())
-            print(f"Given vocab size {vocab_size} is too small to accomodate the default vocab of {len(self.vocab.keys())}, set to {len(self.vocab.keys())} instead")
+            self.vocab_size = len(self.vocab)
+            if self.verbose:
+                print(f"Given vocab size {vocab_size} is too small to accomodate the default vocab of {len(self.vocab)}, set to {len(self.vocab)} instead")
 
     def _rebuild_token_dict(self):
         """Rebuilds encoder and decoder dictionaries based on vocabulary.
@@ -111,49 +414,95 @@ class BPETokenizer:
         Called whenever vocabulary is updated to refresh mappings.
 
         """
-        encoder_dict = {}
-        decoder_dict = {}
-        encoder_dict[self._PAD] = 0
-        decoder_dict[0] = self._PAD
-        encoder_dict[self._UNK] = -999
-        decoder_dict[-999] = self._UNK
-        encoder_dict[self._SOS] = -1
-        decoder_dict[-1] = self._SOS
-        encoder_dict[self._EOS] = -2
-        decoder_dict[-2] = self._EOS
+        encoder_dict = dict(self._RESERVED_IDS)
+        decoder_dict = {token: token_str for token_str, token in self._RESERVED_IDS.items()}
 
         i = 1 
-        for token_str in self.vocab.keys():
-            if token_str in [self._PAD, self._UNK, self._SOS, self._EOS]:
+        for token_str in self.vocab:
+            if token_str in self._RESERVED_IDS:
                 continue
             encoder_dict[token_str] = i
             decoder_dict[i] = token_str
             i += 1
         self.encoder_dict = encoder_dict
         self.decoder_dict = decoder_dict
-        print(f"Token dict created with {len(self.vocab.keys())} elements, encoding and decoding active.")
+
+        merges = self._derive_merges(self.vocab, encoder_dict)
+        self._merges = merges
+        # Keyed by (left_id << 32) | right_id, hashing a single int per lookup.
+        self._merged_ids = {(left_id << 32) | right_id: merged_id for left_id, right_id, merged_id in merges}
+        self._unmerged_symbols = self._find_unmerged(self.vocab, encoder_dict)
+        self._special_ids = {s: encoder_dict[s] for s in self._RESERVED_IDS}
+        # Pieces can only be encoded separately if no symbol spans a space.
+        self._split_on_spaces = not any(" " in token_str for token_str in self.vocab if len(token_str) > 1)
+        self._encode_cache = {}
+        self._encode_cache_old = {}
+        if self.verbose:
+            print(f"Token dict created with {len(self.vocab)} elements, encoding and decoding active.")
+
+    def _extend_token_dict(self, new_keys):
+        """Appends new vocabulary symbols to encoder and decoder dictionaries.
+
+        Assigns the next free indices to the new symbols in vocabulary order
+        and adds their merges, leaving existing entries untouched. Caches
+        depending on the set of symbols are reset if any were added.
+
+        Args:
+            new_keys: Symbols added to the end of the vocabulary.
+
+        """
+        i = len(self.encoder_dict) - len(self._RESERVED_IDS) + 1
+        for token_str in new_keys:
+            self.encoder_dict[token_str] = i
+            self.decoder_dict[i] = token_str
+            i += 1
+        merges = self._derive_merges(new_keys, self.encoder_dict)
+        self._merges.extend(merges)
+        self._merged_ids.update(((left_id << 32) | right_id, merged_id) for left_id, right_id, merged_id in merges)
+        self._unmerged_symbols.extend(self._find_unmerged(new_keys, self.encoder_dict))
+        if new_keys:
+            if any(" " in token_str for token_str in new_keys if len(token_str) > 1):
+                self._split_on_spaces = False
+            self._encode_cache = {}
+            self._encode_cache_old = {}
+        if self.verbose:
+            print(f"Token dict extended with {len(new_keys)} elements, encoding and decoding active.")
+
+    def _find_unmerged(self, token_strs, token_ids):
+        """Lists multi-character symbols that no merge produces.
+
+        These are symbols whose prefix or last character has no id, which
+        only happens for vocabularies not built up by training.
+
+        Args:
+            token_strs: Symbols to check.
+            token_ids: Mapping of symbols and characters to their ids.
+
+        Returns:
+            List of the symbols without a merge, reserved symbols excluded.
+
+        """
+        return [token_str for token_str in token_strs
+                if len(token_str) > 1 and token_str not in self._RESERVED_IDS
+                and (token_str[:-1] not in token_ids or token_str[-1] not in token_ids)]
     
-    def _include_corpus_chars(self, corpus):
-        """Scans corpus text and adds any new characters to vocabulary.
+    def _include_corpus_chars(self, char_counts):
+        """Adds corpus characters and their counts to vocabulary.
     
-        Checks each character of provided corpus text(s). Any newly encountered
-        characters are added to the vocabulary dict with a frequency of 1.
+        Adds the character counts of the corpus to the vocabulary dict. Any
+        newly encountered characters are added with their corpus frequency.
 
         This is used at start of training to initialize vocabulary with corpus
         characters before beginning BPE merge operations.
 
         Args:
-            corpus: Training corpus text(s) to scan for new characters.
+            char_counts: Mapping of corpus characters to their frequencies.
 
         """
-        if isinstance(corpus, list):
-            corpus = "".join(corpus)     
-        for c in corpus:
-            if c in self.vocab.keys():
-                self.vocab[c] += 1
-            else:
-                self.vocab[c] = 1
-        print(f"Updated vocab with corpus chars. Vocab size is now {len(self.vocab.keys())}")
+        for c, n in char_counts.items():
+            self.vocab[c] = self.vocab.get(c, 0) + n
+        if self.verbose:
+            print(f"Updated vocab with corpus chars. Vocab size is now {len(self.vocab)}")
 
     def train(self, corpus, desired_vocab_size:int, word_level = True):
         """Performs core BPE training algorithm on provided corpus.
@@ -169,65 +518,112 @@ class BPETokenizer:
         Updates internal vocabulary dictionary with learned symbols and frequencies.
 
         Args:
-            corpus: Training corpus text(s).
+            corpus: Training corpus text, or an iterable of corpus lines.
             vocab_size: Target size for final vocabulary.
             word_level: Whether to merge within space-separated words.
 
         """
-        _counted_words = {}
-        _temp_vocab = self.vocab.copy()
-        self._set_vocab_size(desired_vocab_size)
-        self._include_corpus_chars(corpus)
         if isinstance(corpus, str):
             corpus = [corpus]
-        if word_level:
-            words = []
-            for c in corpus:
-                words.extend(c.split())
-            for word in words:
-                if word in _counted_words.keys():
-                    _counted_words[word] += 1
-                else:
-                    _counted_words[word] = 1
-            corpus = _counted_words.keys()
+        text_counts, char_counts = _count_corpus(corpus, word_level)
+        self._train_from_counts(text_counts, char_counts, desired_vocab_size)
 
+    def _train_from_counts(self, text_counts, char_counts, desired_vocab_size):
+        """Performs BPE training on a pre-aggregated corpus.
+
+        Training texts (words, or whole lines for character level training)
+        are given with their frequencies, so identical texts are scanned once
+        and weighted by their frequency.
+
+        Args:
+            text_counts: Mapping of training texts to their frequencies.
+            char_counts: Mapping of corpus characters to their frequencies.
+            desired_vocab_size: Target size for final vocabulary.
+
+        """
+        _temp_vocab = self.vocab.copy()
+        self._set_vocab_size(desired_vocab_size)
+        self._include_corpus_chars(char_counts)
+
+        # Training works on integer symbol ids. Every vocab symbol and corpus
+        # character gets an id, texts are converted to lists of character ids
+        # once and symbols are extended through a (symbol id, character id)
+        # merge table, so candidates are pairs of ids rather than strings.
+        symbols = list(_temp_vocab)
+        symbols.extend(c for c in char_counts if c not in _temp_vocab)
+        sym_ids = {token_str: sym_id for sym_id, token_str in enumerate(symbols)}
+        # Pairs of symbol ids are packed into single ints, (left << 32) | right,
+        # for both the merge table and the candidate keys.
+        merges = {(left_id << 32) | right_id: merged_id for left_id, right_id, merged_id in self._derive_merges(symbols, sym_ids)}
+        # Vocab symbols whose prefix is not a symbol yet, e.g. special tokens
+        # or symbols of a loaded vocab, by prefix. Their merge is added once
+        # the prefix is learned, so segments extend into them as before.
+        completions = {}
+        for token_str in symbols:
+            if len(token_str) > 1 and token_str[:-1] not in sym_ids:
+                completions.setdefault(token_str[:-1], []).append(token_str)
+        texts = [list(map(sym_ids.__getitem__, text)) for text in text_counts if len(text) > 2]
+        text_freqs = [text_counts[text] for text in text_counts if len(text) > 2]
+
+        candidates = _MergeCandidates(texts, text_freqs, symbols, merges)
         while len(_temp_vocab) < desired_vocab_size:
-            word_freqs = {}
-            for text in corpus:  
-                i = 0
-                j = 1 
-                if word_level:
-                    inc = _counted_words[text]
-                else:
-                    inc = 1          
-                while j < len(text) and len(text) > 2:
-                    curr_word = text[i:j]
-                    next_char = text[j]
-                    if curr_word + next_char in _temp_vocab.keys():
-                        j += 1
-                    else:
-                        if curr_word+next_char in word_freqs.keys():
-                            word_freqs[curr_word+next_char] += inc
-                        else:
-                            word_freqs[curr_word+next_char] = inc
-                        i = j
-                        j += 1
-            if word_freqs == {}:
+            best = candidates.pop_best()
+            if best is None:
                 if len(_temp_vocab) < desired_vocab_size:
-                    print(f"Ending early at {len(_temp_vocab)}/{desired_vocab_size}, all combinations exhausted")
+                    if self.verbose:
+                        print(f"Ending early at {len(_temp_vocab)}/{desired_vocab_size}, all combinations exhausted")
                     self._set_vocab_size(len(_temp_vocab))
                 break
-            best_pair_str = max(word_freqs, key=word_freqs.get)
-            occurences = word_freqs[max(word_freqs, key=word_freqs.get)]
-            _temp_vocab[best_pair_str] = occurences
-            print(f"Target vocab size: {desired_vocab_size} | Current vocab size: {len(_temp_vocab.keys())}")
+            best_pair, occurences = best
+            best_pair_str = symbols[best_pair >> 32] + symbols[best_pair & 0xFFFFFFFF]
+            merged_id = sym_ids.get(best_pair_str)
+            if merged_id is None:
+                merged_id = len(symbols)
+                symbols.append(best_pair_str)
+                sym_ids[best_pair_str] = merged_id
+                _temp_vocab[best_pair_str] = occurences
+                for token_str in completions.pop(best_pair_str, ()):
+                    right_id = sym_ids.get(token_str[-1])
+                    if right_id is not None:
+                        merges[(merged_id << 32) | right_id] = sym_ids[token_str]
+            merges[best_pair] = merged_id
+            candidates.apply_merge(best_pair)
+            if self.verbose:
+                print(f"Target vocab size: {desired_vocab_size} | Current vocab size: {len(_temp_vocab)}")
         self._update_vocab(_temp_vocab)
 
+    def _derive_merges(self, token_strs, token_ids):
+        """Lists the merges that build up multi-character symbols.
+
+        Every learned symbol extends a shorter symbol by one character, so
+        each symbol whose prefix and last character both have ids yields a
+        (prefix id, last character id, symbol id) merge. Merges are listed
+        in the order of token_strs, i.e. the order the symbols were learned.
+
+        Args:
+            token_strs: Symbols in vocabulary order.
+            token_ids: Mapping of symbols and characters to their ids.
+
+        Returns:
+            List of (left id, right id, merged id) tuples.
+
+        """
+        merges = []
+        for token_str in token_strs:
+            if len(token_str) < 2:
+                continue
+            left_id = token_ids.get(token_str[:-1])
+            right_id = token_ids.get(token_str[-1])
+            if left_id is not None and right_id is not None:
+                merges.append((left_id, right_id, token_ids[token_str]))
+        return merges
+
     def train_from_file(self, corpus_file_path, desired_vocab_size, word_level = True):
         """Helper to perform training directly from a corpus text file.
 
-        Loads training text file, extracts full corpus text, and passes 
-        to train() method along with provided vocab_size and word_level settings.
+        Streams the lines of the training text file to the train() method
+        along with provided vocab_size and word_level settings, so the file
+        is never held in memory as a whole.
 
         Args:
             file_path: Path to training corpus text file.
@@ -236,14 +632,38 @@ class BPETokenizer:
 
         """
         with open(corpus_file_path, "r") as f:
-            corpus = [l.strip() for l in f.readlines()]
-            self.train(corpus, desired_vocab_size, word_level)    
+            self.train((l.strip() for l in f), desired_vocab_size, word_level)
+
+    def train_from_files(self, corpus_file_paths, desired_vocab_size, word_level = True, workers = None):
+        """Helper to perform training from several corpus text files at once.
+
+        Counts the words (or lines) and characters of each file in a separate
+        worker process, merges the counts in file order and trains on them.
+        The result is the same as training on the concatenated files.
+
+        Args:
+            corpus_file_paths: List of paths to training corpus text files.
+            desired_vocab_size: Target size for final vocabulary.
+            word_level: Whether to merge within space-separated words.
+            workers: Number of worker processes, defaults to the CPU count.
+
+        """
+        workers = min(workers or os.cpu_count() or 1, len(corpus_file_paths)) or 1
+        with multiprocessing.Pool(workers) as pool:
+            parts = pool.map(partial(_count_file, word_level=word_level), corpus_file_paths)
+        text_counts = Counter()
+        char_counts = Counter()
+        for part_text_counts, part_char_counts in parts:
+            text_counts.update(part_text_counts)
+            char_counts.update(part_char_counts)
+        self._train_from_counts(text_counts, char_counts, desired_vocab_size)
     
     def save_vocab_file(self, json_file_path:str):
         """Saves current vocabulary dictionary to provided file path as JSON.
 
-        Serializes vocabulary dict as JSON using json module and writes to 
-        specified file path.
+        Serializes vocabulary dict as JSON using orjson if it is installed,
+        json module otherwise, and writes the bytes to specified file path.
+        Non-ASCII symbols are escaped, so the file is plain ASCII either way.
 
         Directory is created if it does not exist.
 
@@ -254,14 +674,14 @@ class BPETokenizer:
         f_dir = os.path.dirname(json_file_path)
         if not os.path.exists(f_dir):
             os.makedirs(f_dir)
-        with open(json_file_path, "w") as f:
-            json.dump(self.vocab, f)
+        with open(json_file_path, "wb") as f:
+            f.write(_json_dumps(self.vocab))
     
     def load_vocab_file(self, json_file_path:str):
         """Loads vocabulary dictionary from a JSON file at given path.
 
-        Uses json module to deserialize vocabulary dictionary stored in 
-        JSON format at specified file path. 
+        Uses orjson if it is installed, json module otherwise, to deserialize
+        vocabulary dictionary stored in JSON format at specified file path. 
 
         Loads dictionary into internal vocabulary attribute, overwriting any
         existing vocabulary.
@@ -270,8 +690,8 @@ class BPETokenizer:
             path: Path to input JSON vocabulary file.
 
         """
-        with open(json_file_path, "r") as f:
-            vocab = json.load(f)
+        with open(json_file_path, "rb") as f:
+            vocab = _json_loads(f.read())
             self._update_vocab(vocab)
 
     def decode(self, tokens):
@@ -295,7 +715,8 @@ class BPETokenizer:
         """Decodes integer tokens into chunks of text symbols.
 
         Looks up each integer token in the decoder dictionary
-        to recover the corresponding symbol string. 
+        to recover the corresponding symbol string. The lookups are
+        mapped over the tokens so the loop runs in C.
 
         Args:
             tokens: List of integer tokens to decode.
@@ -306,10 +727,7 @@ class BPETokenizer:
         """
         if not self.decoder_dict:
             raise ValueError(f"Cannot decode without a decoder dictionary!")        
-        decoded = []
-        for t in tokens:
-            decoded.append(self.decoder_dict[t])
-        return decoded
+        return list(map(self.decoder_dict.__getitem__, tokens))
 
     def encode(self, text, pad_to_tokens=0):
         """Encodes text into corresponding integer tokens.
@@ -317,6 +735,11 @@ class BPETokenizer:
         Iteratively takes the longest matching substring from the vocabulary
         and emits the integer token. Advances to next character and repeats.
 
+        Special PAD, UNK, SOS and EOS symbols are split off first and emitted
+        as their tokens. The text between them is encoded one space-separated
+        piece at a time and the tokens of each piece are cached, so repeated
+        words are only matched once.
+
         Unknown symbols are replaced with UNK token.
 
         If pad_to_tokens specified, pads output to given length.
@@ -332,38 +755,119 @@ class BPETokenizer:
         if not self.encoder_dict:
             raise ValueError(f"Cannot encode without an encoder dictionary!")
         tokens = []
-        i = 0
-        j = 0
-        
-        end_string = False
-
-        while j <= len(text):  
-            if text[i:].startswith(self._PAD):
-                tokens.append(self.encoder_dict[self._PAD])
-                i += len(self._PAD)
-                continue
-            elif text[i:].startswith(self._EOS):
-                tokens.append(self.encoder_dict[self._EOS])
-                i += len(self._EOS)
-                continue
-            curr_word = text[i:j]
-            if j < len(text):
-                next_char = text[j]
-            else:
-                next_char = ""
-                end_string = True
-
-            if curr_word+next_char != "" and (curr_word + next_char not in self.vocab or end_string):
-                try:
-                    tokens.append(self.encoder_dict[curr_word])
-                except KeyError:
-                    print(f"'{curr_word}' in '{text}' not found in vocab, setting to UNK token")
-                    tokens.append(self.encoder_dict[self._UNK])
-                i = j
-            j += 1
+        start = 0
+        for match in self._special_re.finditer(text):
+            if match.start() > start:
+                tokens.extend(self._encode_chunk(text[start:match.start()]))
+            tokens.append(self._special_ids[match.group()])
+            start = match.end()
+        if start < len(text):
+            tokens.extend(self._encode_chunk(text[start:]))
         tokens = self.pad(tokens, pad_to_tokens) if pad_to_tokens > 0 else tokens
         return tokens
-    
+
+    def _encode_chunk(self, chunk):
+        """Encodes text without special symbols into integer tokens.
+
+        Splits the chunk on spaces and encodes each piece, looking it up in
+        the encode cache first. The cache keeps recently used short pieces in
+        two generations: when the current one is full it becomes the old one,
+        and pieces found in the old one are moved back to the current one, so
+        frequent pieces stay cached. Chunks that cannot be split on spaces
+        are encoded whole and not cached, as they rarely repeat. UNK tokens
+        in the result are added to the unknown symbol count.
+
+        Args:
+            chunk: Text to encode, containing no special symbols.
+
+        Returns:
+            List of integer vocabulary indices encoding the chunk.
+
+        """
+        unk_token = self._RESERVED_IDS[self._UNK]
+        if not self._split_on_spaces:
+            tokens = list(self._encode_piece(chunk))
+            self._unk_count += tokens.count(unk_token)
+            return tokens
+        space_token = self.encoder_dict[" "]
+        cache = self._encode_cache
+        tokens = []
+        for n, piece in enumerate(chunk.split(" ")):
+            if n:
+                tokens.append(space_token)
+            piece_tokens = cache.get(piece)
+            if piece_tokens is None:
+                piece_tokens = self._encode_cache_old.get(piece)
+                if piece_tokens is None:
+                    piece_tokens = self._encode_piece(piece)
+                if len(piece) <= _ENCODE_CACHE_MAX_PIECE_LEN:
+                    if len(cache) >= _ENCODE_CACHE_SIZE // 2:
+                        self._encode_cache_old = cache
+                        cache = self._encode_cache = {}
+                    cache[piece] = piece_tokens
+            tokens.extend(piece_tokens)
+        self._unk_count += tokens.count(unk_token)
+        return tokens
+
+    def _encode_piece(self, piece):
+        """Encodes a single piece of text into integer tokens.
+
+        Starts each token from the id of its first character and greedily
+        extends it with the following characters while the merge table has
+        an entry for the (token, character) pair, then emits it.
+
+        If some symbols cannot be reached through the merge table, e.g. a
+        loaded symbol containing a character that is not in the vocabulary,
+        tokens are extended by looking up their strings in the vocabulary
+        instead.
+
+        Args:
+            piece: Piece of text to encode.
+
+        Returns:
+            Tuple of integer vocabulary indices encoding the piece.
+
+        """
+        encoder_get = self.encoder_dict.get
+        merged_get = self._merged_ids.get
+        unk_token = self.encoder_dict[self._UNK]
+        tokens = []
+        i = 0
+        n = len(piece)
+        if self._unmerged_symbols:
+            vocab = self.vocab
+            while i < n:
+                j = i + 1
+                while j < n and piece[i:j + 1] in vocab:
+                    j += 1
+                tokens.append(encoder_get(piece[i:j], unk_token))
+                i = j
+            return tuple(tokens)
+        while i < n:
+            token = encoder_get(piece[i], unk_token)
+            j = i + 1
+            while j < n:
+                merged = merged_get((token << 32) | encoder_get(piece[j], unk_token))
+                if merged is None:
+                    break
+                token = merged
+                j += 1
+            tokens.append(token)
+            i = j
+        return tuple(tokens)
+
+    def get_unk_stats(self):
+        """Reports how many unknown symbols were replaced with UNK token.
+
+        Counts every character encoded as UNK by this tokenizer, instead of
+        reporting each one as it is encountered.
+
+        Returns:
+            Dict with the number of unknown symbols encoded so far.
+
+        """
+        return {"unk_count": self._unk_count}
+
     def pad(self, tokens:list, desired_length):
         """Pads token list to desired length by adding PAD tokens.
     
@@ -385,10 +889,39 @@ class BPETokenizer:
         start_token = self.encoder_dict[self._SOS]
         end_token = self.encoder_dict[self._EOS]
         pad_token = self.encoder_dict[self._PAD]
-        if len(tokens)+2 >= desired_length:
+        if len(tokens)+2 > desired_length:
             raise ValueError(f"Cannot pad {len(tokens)} tokens to desired length of {desired_length}!")
         else:
             tokens.insert(0, start_token)
-            tokens.extend([end_token])
-            [tokens.extend([pad_token]) for _ in range (desired_length - len(tokens))]
-        return tokens
\ No newline at end of file
+            tokens.append(end_token)
+            n = desired_length - len(tokens)
+            if n > 0:
+                tokens.extend([pad_token] * n)
+        return tokens
+
+    def pad_np(self, tokens:list, desired_length):
+        """Pads token list to desired length into a NumPy array.
+
+        Same as pad, but allocates an int32 array of PAD tokens once and
+        copies SOS, the tokens and EOS into it. Requires NumPy.
+
+        Args:
+            tokens: List of tokens to pad.
+            desired_length: Desired length to pad tokens to.
+
+        Returns:
+            Padded int32 NumPy array with SOS, EOS, and PAD tokens added.
+
+        Raises:
+            ValueError if tokens exceed desired length.
+
+        """
+        import numpy as np
+
+        if len(tokens)+2 > desired_length:
+            raise ValueError(f"Cannot pad {len(tokens)} tokens to desired length of {desired_length}!")
+        padded = np.full(desired_length, self.encoder_dict[self._PAD], dtype=np.int32)
+        padded[0] = self.encoder_dict[self._SOS]
+        padded[1:len(tokens)+1] = tokens
+        padded[len(tokens)+1] = self.encoder_dict[self._EOS]
+        return padded
\ No newline at end of file
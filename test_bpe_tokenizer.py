@@ -0,0 +1,125 @@
+import os
+import random
+import tempfile
+import unittest
+
+from bpe_tokenizer import BPETokenizer, _count_corpus
+
+
+def reference_train(tokenizer, corpus, desired_vocab_size, word_level):
+    """Trains like BPETokenizer.train, rescanning every text after each merge.
+
+    Each text is greedily segmented by probing the vocabulary with strings:
+    a segment is extended while segment + next character is in vocab, and
+    otherwise segment + next character is counted as a candidate. The most
+    frequent candidate, first seen on ties, is added until the vocabulary
+    reaches desired_vocab_size or no candidates are left.
+
+    """
+    temp_vocab = tokenizer.vocab.copy()
+    tokenizer._set_vocab_size(desired_vocab_size)
+    text_counts, char_counts = _count_corpus(corpus, word_level)
+    tokenizer._include_corpus_chars(char_counts)
+    texts = [text for text in text_counts if len(text) > 2]
+    while len(temp_vocab) < desired_vocab_size:
+        counts = {}
+        for text in texts:
+            i = 0
+            for j in range(1, len(text)):
+                if text[i:j + 1] not in temp_vocab:
+                    counts[text[i:j + 1]] = counts.get(text[i:j + 1], 0) + text_counts[text]
+                    i = j
+        if not counts:
+            tokenizer._set_vocab_size(len(temp_vocab))
+            break
+        best = max(counts, key=counts.get)
+        temp_vocab[best] = counts[best]
+    tokenizer._update_vocab(temp_vocab)
+
+
+def random_corpus(rng, pieces, n_lines):
+    return [" ".join("".join(rng.choice(pieces) for _ in range(rng.randint(1, 4)))
+                     for _ in range(rng.randint(1, 8)))
+            for _ in range(n_lines)]
+
+
+class TrainMatchesReferenceTest(unittest.TestCase):
+
+    def check(self, pieces, seeds, base_vocab=None):
+        for seed in seeds:
+            for word_level in (True, False):
+                with self.subTest(seed=seed, word_level=word_level):
+                    rng = random.Random(seed)
+                    corpus = random_corpus(rng, pieces, 60 if word_level else 25)
+                    tokenizer = BPETokenizer()
+                    reference = BPETokenizer()
+                    if base_vocab:
+                        tokenizer._update_vocab(base_vocab)
+                        reference._update_vocab(base_vocab)
+                    desired_vocab_size = len(tokenizer.vocab) + rng.randint(5, 80)
+                    tokenizer.train(corpus, desired_vocab_size, word_level)
+                    reference_train(reference, corpus, desired_vocab_size, word_level)
+                    self.assertEqual(list(tokenizer.vocab.items()), list(reference.vocab.items()))
+                    self.assertEqual(tokenizer.vocab_size, reference.vocab_size)
+
+    def test_random_corpora(self):
+        self.check(["a", "b", "ab", "ba", "abc", "cd", "é", "d"], range(20))
+
+    def test_corpora_with_special_symbols(self):
+        self.check(["ab", "xyz", "<|PAD|>", "<|EOS|>", "ba", "abx", "zz"], range(20))
+
+    def test_training_on_loaded_vocab(self):
+        base_vocab = {"xyz": 0, "abxz": 0, "éa": 0, "<|SOS|>a": 0}
+        self.check(["ab", "xyz", "éa", "<|SOS|>", "ba", "abx", "zz", "é"], range(20), base_vocab)
+
+    def test_training_twice(self):
+        rng = random.Random(0)
+        corpus = random_corpus(rng, ["ab", "cd", "abc", "e"], 60)
+        tokenizer = BPETokenizer()
+        reference = BPETokenizer()
+        for desired_vocab_size in (120, 160):
+            tokenizer.train(corpus[:30], desired_vocab_size)
+            reference_train(reference, corpus[:30], desired_vocab_size, True)
+            corpus = corpus[30:]
+        self.assertEqual(list(tokenizer.vocab.items()), list(reference.vocab.items()))
+
+
+class EncodeTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        tokenizer = BPETokenizer()
+        tokenizer.train(["hello world hello there", "other words here"], 120)
+        text = "<|SOS|>hello there <|PAD|>words<|EOS|>"
+        self.assertEqual(tokenizer.decode(tokenizer.encode(text)), text)
+
+    def test_unknown_symbols_are_counted(self):
+        tokenizer = BPETokenizer()
+        tokens = tokenizer.encode("a☃ ☃")
+        self.assertEqual(tokens.count(tokenizer.encoder_dict["<|UNK|>"]), 2)
+        self.assertEqual(tokenizer.get_unk_stats(), {"unk_count": 2})
+
+    def test_loaded_symbol_with_unknown_character(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "vocab.json")
+            with open(path, "w") as f:
+                f.write('{"\\u00e9a": 1}')
+            tokenizer = BPETokenizer(vocab_or_json_path=path)
+        encoder_dict = tokenizer.encoder_dict
+        self.assertEqual(tokenizer.encode("bxéa"), [encoder_dict["b"], encoder_dict["x"], encoder_dict["éa"]])
+        self.assertEqual(tokenizer.encode("aé"), [encoder_dict["a"], encoder_dict["<|UNK|>"]])
+
+    def test_vocab_file_round_trip(self):
+        tokenizer = BPETokenizer()
+        tokenizer.train(["héllo wörld héllo"], 110)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "vocab.json")
+            tokenizer.save_vocab_file(path)
+            with open(path, "rb") as f:
+                self.assertTrue(f.read().isascii())
+            loaded = BPETokenizer(vocab_or_json_path=path)
+        self.assertEqual(list(loaded.vocab.items()), list(tokenizer.vocab.items()))
+        self.assertEqual(loaded.encode("héllo"), tokenizer.encode("héllo"))
+
+
+if __name__ == "__main__":
+    unittest.main()